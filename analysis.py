@@ -1,14 +1,13 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
-import re
-import importlib.util
-import tempfile
 from io import BytesIO
 
 import numpy as np
 import pandas as pd
 
+from normalize import _norm_ar
+
 
 COL_ID = "رقم البلاغ"
 COL_ADMIN = "الإدارة"
@@ -29,27 +28,12 @@ STATUS_CANON = [
     "قيد التنفيذ - مقاول",
     "معلق - اعادة فتح",
 ]
+SLA_BOUNDS = np.array([72, 96])
 SLA_ORDER = ["لم تتجاوز", "قارب على تجاوز SLA", "تجاوز SLA"]
 
 ALLOWED_SOURCES = {"Urbi", "تطبيق بلدي", "توكلنا", "مراكز الاتصال"}
 
 
-def _norm_ar(s: str) -> str:
-    if not isinstance(s, str):
-        return ""
-    s = s.strip()
-    s = (
-        s.replace("أ", "ا")
-         .replace("إ", "ا")
-         .replace("آ", "ا")
-         .replace("ى", "ي")
-         .replace("ة", "ه")
-    )
-    s = re.sub(r"\s+", " ", s)
-    s = s.replace(" -", "-").replace("- ", "-")
-    return s
-
-
 def canon_status(raw: str) -> str:
     s = _norm_ar(raw)
     if "انتظار" in s and "استجابه" in s:
@@ -59,12 +43,12 @@ def canon_status(raw: str) -> str:
             return "انتظار الاستجابة - مراقب"
         if "مشرف" in s:
             return "انتظار الاستجابة - مشرف"
-    if ("قيد" in s and "التنفيذ" in s) or ("التنفيذ" in s and ("قيد" in s or "جاري" in s)):
+    if "التنفيذ" in s and ("قيد" in s or "جاري" in s):
         if "مراقب" in s:
             return "قيد التنفيذ - مراقب"
         if "مقاول" in s:
             return "قيد التنفيذ - مقاول"
-    if "معلق" in s and ("اعاده فتح" in s or "اعادة فتح" in s or "فتح" in s):
+    if "معلق" in s and "فتح" in s:
         return "معلق - اعادة فتح"
     return raw
 
@@ -77,39 +61,39 @@ def canon_source(x: str) -> str:
         return "تطبيق بلدي"
     if "توكلنا" in s:
         return "توكلنا"
-    if ("مراكز" in s and "اتصال" in s) or ("مركز" in s and "اتصال" in s):
+    if ("مراكز" in s or "مركز" in s) and "اتصال" in s:
         return "مراكز الاتصال"
     return x
 
 
+def _map_unique(col: pd.Series, fn) -> pd.Series:
+    col = col.astype(str)
+    uniq = pd.unique(col)
+    return col.map(dict(zip(uniq, map(fn, uniq))))
+
+
 def read_excel_safe(uploaded):
-    data = uploaded.read()
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp:
-        tmp.write(data)
-        path = tmp.name
-
-    engines = []
-    if importlib.util.find_spec("calamine") or importlib.util.find_spec("python_calamine"):
-        engines.append("calamine")
-    engines += [None, "openpyxl"]
-
-    last = None
-    for eng in engines:
+    buf = BytesIO(uploaded.read())
+    try:
         try:
-            return pd.read_excel(path, sheet_name=0, engine=eng)
-        except Exception as e:
-            last = e
-            continue
-
-    raise RuntimeError(f"تعذر قراءة الملف: {last}")
+            return pd.read_excel(
+                buf, sheet_name=0, engine="calamine", dtype_backend="pyarrow"
+            )
+        except ImportError:
+            buf.seek(0)
+            return pd.read_excel(buf, sheet_name=0, engine="openpyxl")
+    except Exception as e:
+        raise RuntimeError(f"تعذر قراءة الملف: {e}") from e
 
 
 def parse_created_col(s):
-    a = pd.to_datetime(s, errors="coerce", dayfirst=False)
-    b = pd.to_datetime(s, errors="coerce", dayfirst=True)
-    if b.notna().sum() > a.notna().sum():
-        return b
-    return a
+    uniq = pd.Series(pd.unique(s.dropna().astype(str)), dtype="string")
+    first = pd.to_numeric(
+        uniq.str.extract(r"^\s*(\d{1,2})/\d{1,2}/", expand=False),
+        errors="coerce",
+    )
+    dayfirst = bool((first > 12).any())
+    return pd.to_datetime(s, errors="coerce", dayfirst=dayfirst)
 
 
 def preprocess(df: pd.DataFrame, closed_ts: pd.Timestamp):
@@ -119,7 +103,7 @@ def preprocess(df: pd.DataFrame, closed_ts: pd.Timestamp):
         df.columns[i]
         for i in range(idx_created + 1, min(idx_created + 4, len(df.columns)))
     ]
-    df = df.drop(columns=drop_after, errors="ignore").copy()
+    df = df.drop(columns=drop_after, errors="ignore")
 
     sidx = df.columns.get_loc(COL_SOURCE)
     right_cols = list(df.columns[sidx + 1:])
@@ -132,16 +116,21 @@ def preprocess(df: pd.DataFrame, closed_ts: pd.Timestamp):
     rows_before = len(df)
 
     if NEW_CLASS_COL in df.columns:
-        df = df[
-            df[NEW_CLASS_COL]
-            .astype(str)
-            .map(_norm_ar)
-            != _norm_ar(BAD_CLASS)
-        ].copy()
-
-    rows_after = len(df)
+        mask_class = _map_unique(df[NEW_CLASS_COL], _norm_ar).ne(_norm_ar(BAD_CLASS))
+    else:
+        mask_class = pd.Series(True, index=df.index)
+
+    status_canon = _map_unique(df[COL_STATUS], canon_status)
+    source_canon = _map_unique(df[COL_SOURCE], canon_source)
+    mask_status = status_canon.isin(STATUS_CANON)
+    mask_src = source_canon.isin(ALLOWED_SOURCES)
+
+    rows_after = int(mask_class.sum())
     deleted = rows_before - rows_after
 
+    mask = mask_class & mask_status & mask_src
+    df = df.loc[mask].copy()
+
     df["_deleted_bad_class"] = deleted
     df["_rows_before_filter"] = rows_before
     df["_rows_after_filter"] = rows_after
@@ -158,24 +147,21 @@ def preprocess(df: pd.DataFrame, closed_ts: pd.Timestamp):
 
     df[COL_ELAPSED] = df[COL_CLOSED] - df[COL_CREATED]
 
-    total_seconds = df[COL_ELAPSED].dt.total_seconds()
-    hours_floor = np.floor_divide(total_seconds.fillna(0).astype("int64"), 3600)
-    df[COL_HOURS] = pd.Series(hours_floor, index=df.index).astype("Int64")
+    elapsed_ns = df[COL_ELAPSED].to_numpy(dtype="timedelta64[ns]").view("i8")
+    hours_floor = np.where(
+        elapsed_ns == np.iinfo("i8").min, 0, elapsed_ns // 3_600_000_000_000
+    )
+    df[COL_HOURS] = pd.array(hours_floor, dtype="Int64")
 
-    df["_status_canon"] = df[COL_STATUS].astype(str).map(canon_status)
-    df = df[df["_status_canon"].isin(STATUS_CANON)].copy()
     df["_status_canon"] = pd.Categorical(
-        df["_status_canon"], categories=STATUS_CANON, ordered=True
+        status_canon[mask], categories=STATUS_CANON, ordered=True
     )
+    df[COL_SOURCE] = source_canon[mask]
 
-    df[COL_SOURCE] = df[COL_SOURCE].astype(str).map(canon_source)
-    df = df[df[COL_SOURCE].isin(ALLOWED_SOURCES)].copy()
-
-    h = df[COL_HOURS].astype("float")
-    conds = [h < 72, (h >= 72) & (h <= 95)]
-    choices = ["لم تتجاوز", "قارب على تجاوز SLA"]
-    df[COL_SLA] = np.select(conds, choices, default="تجاوز SLA")
-    df[COL_SLA] = pd.Categorical(df[COL_SLA], categories=SLA_ORDER, ordered=True)
+    sla_codes = np.searchsorted(SLA_BOUNDS, hours_floor, side="right")
+    df[COL_SLA] = pd.Categorical.from_codes(
+        sla_codes, categories=SLA_ORDER, ordered=True
+    )
 
     return df
 
@@ -183,18 +169,20 @@ def preprocess(df: pd.DataFrame, closed_ts: pd.Timestamp):
 
 def pivots(df_proc: pd.DataFrame):
     p_open = (
-        df_proc.groupby([COL_ADMIN, "_status_canon"])[COL_ID]
-        .count()
+        df_proc.groupby([COL_ADMIN, "_status_canon"], observed=True, sort=False)
+        .size()
         .unstack("_status_canon", fill_value=0)
+        .sort_index()
         .reindex(columns=STATUS_CANON, fill_value=0)
     )
     p_open.loc["الإجمالي الكلي"] = p_open.sum(axis=0)
     p_open.columns.name = None
 
     p_sla = (
-        df_proc.groupby([COL_ADMIN, COL_SLA])[COL_ID]
-        .count()
+        df_proc.groupby([COL_ADMIN, COL_SLA], observed=True, sort=False)
+        .size()
         .unstack(COL_SLA, fill_value=0)
+        .sort_index()
         .reindex(columns=SLA_ORDER, fill_value=0)
     )
     p_sla.loc["الإجمالي الكلي"] = p_sla.sum(axis=0)
@@ -203,28 +191,41 @@ def pivots(df_proc: pd.DataFrame):
     return p_open, p_sla
 
 
-def build(xls: pd.DataFrame, closed_ts: pd.Timestamp) -> BytesIO:
-    df_all = preprocess(xls.copy(), closed_ts)
-
-    df_ar = df_all[df_all[COL_SOURCE] != "Urbi"].copy()
+def report_pivots(df_all: pd.DataFrame):
+    df_ar = df_all[df_all[COL_SOURCE] != "Urbi"]
     p_open_ar, p_sla_ar = pivots(df_ar)
 
-    df_urbi = df_all[df_all[COL_SOURCE] == "Urbi"].copy()
+    df_urbi = df_all[df_all[COL_SOURCE] == "Urbi"]
     if df_urbi.empty:
-        p_urbi = pd.DataFrame({"ملاحظة": ["لا توجد بلاغات Urbi"]})
-        urbi_index = False
+        p_urbi = pd.DataFrame()
     else:
         p_urbi = (
-            df_urbi.groupby([COL_ADMIN, COL_SOURCE])[COL_ID]
-            .count()
+            df_urbi.groupby([COL_ADMIN, COL_SOURCE], observed=True, sort=False)
+            .size()
             .unstack(COL_SOURCE, fill_value=0)
+            .sort_index()
         )
         p_urbi.loc["الإجمالي الكلي"] = p_urbi.sum(axis=0)
         p_urbi.columns.name = None
+
+    return p_open_ar, p_sla_ar, p_urbi
+
+
+def build_from_pivots(
+    p_open_ar: pd.DataFrame, p_sla_ar: pd.DataFrame, p_urbi: pd.DataFrame
+) -> BytesIO:
+    if p_urbi.empty:
+        p_urbi = pd.DataFrame({"ملاحظة": ["لا توجد بلاغات Urbi"]})
+        urbi_index = False
+    else:
         urbi_index = True
 
     out = BytesIO()
-    with pd.ExcelWriter(out, engine="openpyxl") as w:
+    with pd.ExcelWriter(
+        out,
+        engine="xlsxwriter",
+        engine_kwargs={"options": {"strings_to_urls": False}},
+    ) as w:
         p_open_ar.to_excel(w, sheet_name="١- المفتوحة والمعاد فتحها")
         p_sla_ar.to_excel(w, sheet_name="٢- التوصيف")
         p_urbi.to_excel(w, sheet_name="٣- مصادر أخرى", index=urbi_index)
@@ -232,22 +233,10 @@ def build(xls: pd.DataFrame, closed_ts: pd.Timestamp) -> BytesIO:
     return out
 
 
-def get_pivots_for_ppt(xls: pd.DataFrame, closed_ts: pd.Timestamp):
+def build_all(
+    xls: pd.DataFrame, closed_ts: pd.Timestamp
+) -> tuple[BytesIO, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     df_all = preprocess(xls.copy(), closed_ts)
-
-    df_ar = df_all[df_all[COL_SOURCE] != "Urbi"].copy()
-    p_open_ar, p_sla_ar = pivots(df_ar)
-
-    df_urbi = df_all[df_all[COL_SOURCE] == "Urbi"].copy()
-    if df_urbi.empty:
-        p_urbi = pd.DataFrame()
-    else:
-        p_urbi = (
-            df_urbi.groupby([COL_ADMIN, COL_SOURCE])[COL_ID]
-            .count()
-            .unstack(COL_SOURCE, fill_value=0)
-        )
-        p_urbi.loc["الإجمالي الكلي"] = p_urbi.sum(axis=0)
-        p_urbi.columns.name = None
-
-    return p_open_ar, p_sla_ar, p_urbi
+    p_open_ar, p_sla_ar, p_urbi = report_pivots(df_all)
+    out = build_from_pivots(p_open_ar, p_sla_ar, p_urbi)
+    return out, p_open_ar, p_sla_ar, p_urbi
@@ -2,22 +2,38 @@
 from __future__ import annotations
 
 from datetime import datetime, date, time
+from io import BytesIO
 import base64
 
 import pandas as pd
 import streamlit as st
 
-from analysis import read_excel_safe, build, get_pivots_for_ppt
+from analysis import read_excel_safe, build_all
 from ppt_fill import fill_ppt
 
 st.set_page_config(page_title="Reports 940", layout="centered")
 
+PPT_TEMPLATE = "templates/balady_template.pptx"
+
 
 def get_base64_image(path: str) -> str:
     with open(path, "rb") as f:
         return base64.b64encode(f.read()).decode()
 
 
+@st.cache_data(show_spinner=False, max_entries=8)
+def _read(file_bytes: bytes) -> pd.DataFrame:
+    return read_excel_safe(BytesIO(file_bytes))
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _pipeline(file_bytes: bytes, closed_ts: pd.Timestamp) -> tuple[bytes, bytes]:
+    df0 = _read(file_bytes)
+    out_excel, p_open_ar, p_sla_ar, p_urbi = build_all(df0, closed_ts)
+    out_ppt = fill_ppt(PPT_TEMPLATE, p_open_ar, p_sla_ar, p_urbi, closed_ts)
+    return out_excel.getvalue(), out_ppt.getvalue()
+
+
 amanah_b64 = get_base64_image("./assets/amanah_logo.png")
 center_b64 = get_base64_image("./assets/center_logo.png")
 vision_b64 = get_base64_image("./assets/vision2030_logo.png")
@@ -136,27 +152,20 @@ CLOSED_DT = pd.Timestamp(datetime.combine(d_closed, t_closed))
 
 
 if uploaded_file is not None:
-    df0 = read_excel_safe(uploaded_file)
-
-    out_excel = build(df0, CLOSED_DT)
-
-    p_open_ar, p_sla_ar, p_urbi = get_pivots_for_ppt(df0, CLOSED_DT)
-
-    ppt_template = "templates/balady_template.pptx"
-    out_ppt = fill_ppt(ppt_template, p_open_ar, p_sla_ar, p_urbi, CLOSED_DT)
+    excel_bytes, ppt_bytes = _pipeline(uploaded_file.getvalue(), CLOSED_DT)
 
     c1, c2 = st.columns(2)
     with c1:
         st.download_button(
             "Download Excel report",
-            data=out_excel.getvalue(),
+            data=excel_bytes,
             file_name="report_balady.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         )
     with c2:
         st.download_button(
             "Download PowerPoint report",
-            data=out_ppt.getvalue(),
+            data=ppt_bytes,
             file_name="report_balady.pptx",
             mime="application/vnd.openxmlformats-officedocument.presentationml.presentation",
         )
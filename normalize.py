@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import re
+
+
+_AR_TRANS = str.maketrans({
+    "أ": "ا",
+    "إ": "ا",
+    "آ": "ا",
+    "ى": "ي",
+    "ة": "ه",
+})
+_WS_RE = re.compile(r"\s+")
+_DASH_RE = re.compile(r"\s*-\s*")
+
+
+def _norm_ar(s: str) -> str:
+    if not isinstance(s, str):
+        return ""
+    s = s.strip().translate(_AR_TRANS)
+    s = _WS_RE.sub(" ", s)
+    return _DASH_RE.sub("-", s)
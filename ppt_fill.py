@@ -1,40 +1,34 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+from copy import deepcopy
+from functools import lru_cache
 from io import BytesIO
+from pathlib import Path
 import re
+from typing import Callable, Iterable, NamedTuple
 
+import numpy as np
 import pandas as pd
 from pptx import Presentation
 from pptx.dml.color import RGBColor
+from pptx.oxml.ns import qn
 
+from normalize import _norm_ar
 
-def _norm_ar(s: str) -> str:
-    if not isinstance(s, str):
-        return ""
-    s = s.strip()
-    s = (
-        s.replace("أ", "ا")
-         .replace("إ", "ا")
-         .replace("آ", "ا")
-         .replace("ى", "ي")
-         .replace("ة", "ه")
-    )
-    s = re.sub(r"\s+", " ", s)
-    s = s.replace(" -", "-").replace("- ", "-")
-    return s
+
+_KW_STOP = frozenset({
+    "الاداره", "اداره", "الادارة",
+    "العامه", "عامه", "العامة",
+    "بلديه", "بلدية",
+    "امانه", "امانة",
+    "مدينه", "مدينة", "المدينه",
+    "منطقه", "منطقة", "المنطقه",
+})
 
 
-def _keywords(s: str) -> set[str]:
+def _keywords(s: str) -> frozenset[str]:
     s = _norm_ar(s)
-    stop = {
-        "الاداره", "اداره", "الادارة",
-        "العامه", "عامه", "العامة",
-        "بلديه", "بلدية",
-        "امانه", "امانة",
-        "مدينه", "مدينة", "المدينه",
-        "منطقه", "منطقة", "المنطقه",
-    }
     toks: list[str] = []
     for t in s.split():
         if not t:
@@ -45,9 +39,65 @@ def _keywords(s: str) -> set[str]:
             t = t[2:]
         elif t.startswith("ل") and len(t) > 2:
             t = t[1:]
-        if t and t not in stop:
+        if t and t not in _KW_STOP:
             toks.append(t)
-    return set(toks)
+    return frozenset(toks)
+
+
+class _AdminKey(NamedTuple):
+    norm: str
+    kw: frozenset[str]
+    muni: bool
+    south: bool
+    north: bool
+    center: bool
+    muni_service: bool
+    clean: bool
+    main_clean: bool
+    main_projects: bool
+    city_projects: bool
+    ops: bool
+    ops_or_lighting: bool
+    env: bool
+
+
+def _classify_admin(name: str) -> _AdminKey:
+    n = _norm_ar(name)
+    is_main = "اداره" in n and "عامه" in n
+    clean = "النظافه" in n
+    projects = "مشاريع" in n
+    ops = "تشغيل" in n and "صيان" in n
+    return _AdminKey(
+        norm=n,
+        kw=_keywords(n),
+        muni="بلديه" in n,
+        south="جنوب" in n,
+        north="شمال" in n,
+        center="وسط" in n,
+        muni_service="تعمير" in n or ("رقابه" in n and "الخدمات" in n),
+        clean=clean,
+        main_clean=clean and is_main,
+        main_projects=projects and is_main,
+        city_projects=projects and "تنسيق" not in n and "المدينه" in n,
+        ops=ops,
+        ops_or_lighting=ops or "اناره" in n,
+        env="الاصحاح" in n and "البيئي" in n,
+    )
+
+
+def _admin_key(name: str, admin_cache: dict[str, _AdminKey]) -> _AdminKey:
+    key = admin_cache.get(name)
+    if key is None:
+        key = admin_cache[name] = _classify_admin(name)
+    return key
+
+
+def _build_admin_cache(*names: Iterable[str]) -> dict[str, _AdminKey]:
+    cache: dict[str, _AdminKey] = {}
+    for group in names:
+        for name in group:
+            _admin_key(name, cache)
+    return cache
 
 
 def _find_main_table(slide):
@@ -58,26 +108,23 @@ def _find_main_table(slide):
     return main
 
 
+_HEADER_RE = re.compile(
+    r"(?P<admin>الادارات|الاداره)"
+    r"|(?P<open>البلاغات المفتوحه)"
+    r"|(?P<reopen>اعاده فتح|المعاد فتحها)"
+    r"|(?P<near>قارب)"
+    r"|(?P<late>المتاخره|تجاوز sla)"
+    r"|(?P<other>مصادر اخري)"
+)
+
+
 def _detect_main_columns(table):
     header = table.rows[0].cells
     m = dict(admin=None, open=None, reopen=None, near=None, late=None, other=None)
 
     for i, c in enumerate(header):
-        txt = c.text
-        tnorm = _norm_ar(txt)
-
-        if any(k in tnorm for k in ["الادارات", "الاداره", "الادارة"]):
-            m["admin"] = i
-        if "البلاغات المفتوحه" in tnorm or "البلاغات المفتوحة" in txt:
-            m["open"] = i
-        if "اعادة فتح" in tnorm or "المعاد فتحها" in tnorm:
-            m["reopen"] = i
-        if "قارب" in tnorm or "قارب على تجاوز" in tnorm:
-            m["near"] = i
-        if "المتأخره" in tnorm or "المتأخرة" in txt or "تجاوز sla" in tnorm:
-            m["late"] = i
-        if "مصادر اخرى" in tnorm or "مصادر أخرى" in txt:
-            m["other"] = i
+        for match in _HEADER_RE.finditer(_norm_ar(c.text)):
+            m[match.lastgroup] = i
 
     if m["admin"] is None:
         m["admin"] = 0
@@ -85,23 +132,75 @@ def _detect_main_columns(table):
     return m
 
 
-def _make_shape_text_white(shape) -> None:
-    if not shape.has_text_frame:
+def _write_paragraph(p, text: str) -> None:
+    p_el = p._p
+    r_el = p_el.find(qn("a:r"))
+    br_el = p_el.find(qn("a:br"))
+    rPr = r_el.find(qn("a:rPr")) if r_el is not None else None
+    br_rPr = br_el.find(qn("a:rPr")) if br_el is not None else None
+
+    for tag in ("a:r", "a:br", "a:fld"):
+        for el in p_el.findall(qn(tag)):
+            p_el.remove(el)
+
+    for i, segment in enumerate(text.split("\v")):
+        if i:
+            br = p_el.add_br()
+            if br_rPr is not None:
+                br.insert(0, deepcopy(br_rPr))
+        if segment:
+            r = p_el.add_r()
+            r.text = segment
+            if rPr is not None:
+                r.insert(0, deepcopy(rPr))
+
+
+def _replace_in_shape(shape, replace: Callable[[str], str]) -> bool:
+    tf = shape.text_frame
+    paragraphs = tf.paragraphs
+    txt = tf.text
+    new_txt = replace(txt)
+    if new_txt == txt:
+        return False
+
+    # placeholders may span runs, line breaks or paragraphs; rewrite only the
+    # paragraphs whose text changed, each keeping its first run's formatting
+    lines = new_txt.split("\n")
+    if len(lines) > len(paragraphs):
+        lines[len(paragraphs) - 1:] = ["\v".join(lines[len(paragraphs) - 1:])]
+    for p, line in zip(paragraphs, lines):
+        if p.text != line:
+            _write_paragraph(p, line)
+    for p in paragraphs[len(lines):]:
+        tf._txBody.remove(p._p)
+
+    return True
+
+
+def _set_cell_number(cell, val) -> None:
+    txBody = cell._tc.txBody
+    t_elems = txBody.findall(".//" + qn("a:t"))
+    if t_elems:
+        t_elems[0].text = str(val)
+        for t in t_elems[1:]:
+            r = t.getparent()
+            r.getparent().remove(r)
         return
-    for p in shape.text_frame.paragraphs:
-        for run in p.runs:
-            run.font.color.rgb = RGBColor(255, 255, 255)
 
-
-def _make_cell_text_white(cell) -> None:
-    if not cell.text_frame:
-        return
-    for p in cell.text_frame.paragraphs:
-        for run in p.runs:
-            run.font.color.rgb = RGBColor(255, 255, 255)
+    # empty template cell: give the new run the paragraph's end formatting
+    p = txBody.find(qn("a:p"))
+    r = p.add_r()
+    r.text = str(val)
+    end_rPr = p.find(qn("a:endParaRPr"))
+    if end_rPr is not None:
+        rPr = r.get_or_add_rPr()
+        for k, v in end_rPr.attrib.items():
+            rPr.set(k, v)
+        for child in end_rPr:
+            rPr.append(deepcopy(child))
 
 
-def _fill_date_placeholder(prs: Presentation, closed_dt: pd.Timestamp) -> None:
+def _fill_date_placeholder(shapes: list, closed_dt: pd.Timestamp) -> None:
     weekday_map = {
         0: "الاثنين",
         1: "الثلاثاء",
@@ -115,48 +214,39 @@ def _fill_date_placeholder(prs: Presentation, closed_dt: pd.Timestamp) -> None:
     date_str = closed_dt.strftime("%Y-%m-%d")
     full_text = f"التحديث اليومي {weekday_ar} {date_str}"
 
-    for slide in prs.slides:
-        for shape in slide.shapes:
-            if not shape.has_text_frame:
-                continue
-            txt = shape.text
-            if "{{DATE}}" not in txt and "{DATE}" not in txt:
-                continue
-            txt = txt.replace("{{DATE}}", full_text).replace("{DATE}", full_text)
-            shape.text = txt
-            _make_shape_text_white(shape)
+    for shape in shapes:
+        _replace_in_shape(
+            shape,
+            lambda t: t.replace("{{DATE}}", full_text).replace("{DATE}", full_text),
+        )
 
 
 def _fill_total_placeholders(
-    prs: Presentation,
+    shapes: list,
     open_total_all: int,
     near_total_all: int,
     late_total_all: int,
     other_total_all: int,
 ) -> None:
     repl = {
-        "{OPEN_TOTAL}": str(open_total_all),
         "{{OPEN_TOTAL}}": str(open_total_all),
-        "{NEAR_SLA_TOTAL}": str(near_total_all),
+        "{OPEN_TOTAL}": str(open_total_all),
         "{{NEAR_SLA_TOTAL}}": str(near_total_all),
-        "{LATE_TOTAL}": str(late_total_all),
+        "{NEAR_SLA_TOTAL}": str(near_total_all),
         "{{LATE_TOTAL}}": str(late_total_all),
-        "{OTHER_TOTAL}": str(other_total_all),
+        "{LATE_TOTAL}": str(late_total_all),
         "{{OTHER_TOTAL}}": str(other_total_all),
+        "{OTHER_TOTAL}": str(other_total_all),
     }
 
-    for slide in prs.slides:
-        for shape in slide.shapes:
-            if not shape.has_text_frame:
-                continue
-            text = shape.text
-            changed = False
-            for token, val in repl.items():
-                if token in text:
-                    text = text.replace(token, val)
-                    changed = True
-            if changed:
-                shape.text = text
+    def replace(text: str) -> str:
+        for token, val in repl.items():
+            if token in text:
+                text = text.replace(token, val)
+        return text
+
+    for shape in shapes:
+        _replace_in_shape(shape, replace)
 
 
 def _find_reopen_column(df: pd.DataFrame) -> str | None:
@@ -179,129 +269,151 @@ def _find_sla_columns(df: pd.DataFrame):
     return near_col, late_col
 
 
-def _match_admin_indices(admin_in_slide: str, all_admins: list[str]) -> list[str]:
-    s = _norm_ar(admin_in_slide)
-    kw_s = _keywords(s)
+def _match_admin_indices(
+    admin_in_slide: str,
+    all_admins: list[str],
+    admin_cache: dict[str, _AdminKey],
+) -> list[str]:
+    s = _admin_key(admin_in_slide, admin_cache)
+    by_region = s.muni and (s.south or s.north or s.center)
 
     matches: list[str] = []
 
-    is_muni = ("بلديه" in s or "بلدية" in s)
-    is_south = "جنوب" in s
-    is_north = "شمال" in s
-    is_center = "وسط" in s
-
-    is_main_clean = (
-        ("النظافه" in s or "النظافة" in s)
-        and ("اداره" in s or "الاداره" in s or "الادارة" in s)
-        and ("عامه" in s or "العامه" in s or "العامة" in s)
-    )
-
-    is_main_projects = (
-        ("مشاريع" in s)
-        and ("اداره" in s or "الاداره" in s or "الادارة" in s)
-        and ("عامه" in s or "العامه" in s or "العامة" in s)
-    )
-
     for name in all_admins:
-        n = _norm_ar(name)
-        kw_n = _keywords(n)
-
-        if is_muni and (is_south or is_north or is_center):
-            if is_south and "جنوب" in n and (
-                "تعمير" in n or ("رقابه" in n and "الخدمات" in n)
-            ):
-                matches.append(name)
-                continue
-
-            if is_north and "شمال" in n and (
-                "تعمير" in n or ("رقابه" in n and "الخدمات" in n)
-            ):
-                matches.append(name)
-                continue
+        n = _admin_key(name, admin_cache)
 
-            if is_center and "وسط" in n and (
-                "تعمير" in n or ("رقابه" in n and "الخدمات" in n)
+        if by_region:
+            if n.muni_service and (
+                (s.south and n.south)
+                or (s.north and n.north)
+                or (s.center and n.center)
             ):
                 matches.append(name)
-                continue
-
             continue
 
-        if is_main_clean:
-            if "النظافه" in n or "النظافة" in n:
-                matches.append(name)
-                continue
-
-        if is_main_projects:
-            if ("مشاريع" in n) and ("تنسيق" not in n) and (
-                "مدينة" in n or "المدينه" in n):
-                matches.append(name)
+        if s.main_clean and n.clean:
+            matches.append(name)
             continue
 
-
-        if is_main_projects:
-            if "مشاريع" in n:
+        if s.main_projects:
+            if n.city_projects:
                 matches.append(name)
-                continue
-
-        if ("تشغيل" in s and "صيان" in s):
-            if ("تشغيل" in n and "صيان" in n) or ("اناره" in n) or ("انارة" in n):
-                matches.append(name)
-                continue
-
-        if ("الاصحاح" in s and "البيئي" in s):
-            if "الاصحاح" in n and "البيئي" in n:
-                matches.append(name)
-                continue
+            continue
 
-        if n == s:
+        if s.ops and n.ops_or_lighting:
             matches.append(name)
             continue
 
-        if kw_n == kw_s or kw_n.issubset(kw_s) or kw_s.issubset(kw_n):
+        if s.env and n.env:
             matches.append(name)
             continue
 
-    seen = set()
-    ordered = []
-    for name in all_admins:
-        if name in matches and name not in seen:
-            ordered.append(name)
-            seen.add(name)
-    return ordered
+        if n.norm == s.norm or n.kw <= s.kw or s.kw <= n.kw:
+            matches.append(name)
+
+    return matches
+
+
+class _PivotArrays(NamedTuple):
+    values: np.ndarray
+    row_idx: dict[str, int]
+    col_idx: dict[object, int]
 
+    def sum_rows(self, names: list[str]) -> np.ndarray:
+        rows = [self.row_idx[n] for n in names if n in self.row_idx]
+        return self.values[rows].sum(axis=0)
 
-def _aggregate_for_admin(admin_in_slide: str, df: pd.DataFrame) -> pd.Series:
-    if df is None or df.empty:
-        return pd.Series(0, index=df.columns if hasattr(df, "columns") else [])
+
+def _pivot_arrays(df: pd.DataFrame | None) -> _PivotArrays:
+    if df is None:
+        return _PivotArrays(np.zeros((0, 0), dtype=np.int64), {}, {})
 
     df = df.copy()
     df.index = df.index.astype(str)
     if "الإجمالي الكلي" in df.index:
         df = df.drop(index="الإجمالي الكلي")
 
-    all_admins = list(df.index)
-    idxs = _match_admin_indices(admin_in_slide, all_admins)
-    if not idxs:
-        return pd.Series(0, index=df.columns)
+    return _PivotArrays(
+        values=df.to_numpy(dtype=np.int64),
+        row_idx={name: i for i, name in enumerate(df.index)},
+        col_idx={col: j for j, col in enumerate(df.columns)},
+    )
 
-    sub = df.loc[idxs]
-    if isinstance(sub, pd.Series):
-        return sub
-    return sub.sum(axis=0)
 
+_ZERO_METRICS = {"open": 0, "reopen": 0, "near": 0, "late": 0, "other": 0}
 
-def _fill_main_table(
-    table,
+
+class _AdminMetrics(dict):
+    """Per-admin metrics; admins not precomputed are computed on lookup."""
+
+    def __init__(self, compute: Callable[[str], dict[str, int]]):
+        super().__init__()
+        self._compute = compute
+
+    def __missing__(self, admin: str) -> dict[str, int]:
+        m = self[admin] = self._compute(admin) if admin else dict(_ZERO_METRICS)
+        return m
+
+
+def _compute_metrics(
+    slide_admins: set[str],
     p_open: pd.DataFrame,
     p_sla: pd.DataFrame,
     p_other: pd.DataFrame | None,
-):
-    colmap = _detect_main_columns(table)
-
+) -> _AdminMetrics:
     reopen_col = _find_reopen_column(p_open)
     near_col, late_col = _find_sla_columns(p_sla)
 
+    open_arr = _pivot_arrays(p_open)
+    sla_arr = _pivot_arrays(p_sla)
+    other_arr = _pivot_arrays(p_other)
+
+    admin_cache = _build_admin_cache(
+        open_arr.row_idx, sla_arr.row_idx, other_arr.row_idx
+    )
+    all_admins = list(admin_cache)
+
+    reopen_j = open_arr.col_idx[reopen_col] if reopen_col is not None else None
+    near_j = sla_arr.col_idx[near_col] if near_col else None
+    late_j = sla_arr.col_idx[late_col] if late_col else None
+
+    def compute(admin: str) -> dict[str, int]:
+        matches = _match_admin_indices(admin, all_admins, admin_cache)
+
+        sub = open_arr.sum_rows(matches)
+        reopen_val = int(sub[reopen_j]) if reopen_j is not None else 0
+        open_val = int(sub.sum()) - reopen_val
+
+        sub = sla_arr.sum_rows(matches)
+        near_val = int(sub[near_j]) if near_j is not None else 0
+        late_val = int(sub[late_j]) if late_j is not None else 0
+
+        other_val = int(other_arr.sum_rows(matches).sum())
+
+        return {
+            "open": open_val,
+            "reopen": reopen_val,
+            "near": near_val,
+            "late": late_val,
+            "other": other_val,
+        }
+
+    metrics = _AdminMetrics(compute)
+    for admin in slide_admins:
+        metrics[admin] = compute(admin)
+    return metrics
+
+
+def _cell_admin_name(cell) -> str:
+    return cell.text.strip()
+
+
+def _fill_main_table(
+    table,
+    metrics: _AdminMetrics,
+):
+    colmap = _detect_main_columns(table)
+
     total_open = total_reopen = total_near = total_late = total_other = 0
     total_row_idx = None
 
@@ -309,7 +421,7 @@ def _fill_main_table(
 
     for r in range(1, n_rows):
         cells = table.rows[r].cells
-        admin_txt = cells[colmap["admin"]].text.strip()
+        admin_txt = _cell_admin_name(cells[colmap["admin"]])
         norm_admin = _norm_ar(admin_txt)
 
         if not admin_txt:
@@ -319,33 +431,23 @@ def _fill_main_table(
             total_row_idx = r
             continue
 
-        vals_open = _aggregate_for_admin(admin_txt, p_open)
-        if reopen_col is not None:
-            reopen_val = int(vals_open.get(reopen_col, 0))
-        else:
-            reopen_val = 0
-        open_val = int(vals_open.sum() - reopen_val)
-
-        vals_sla = _aggregate_for_admin(admin_txt, p_sla)
-        near_val = int(vals_sla.get(near_col, 0)) if near_col else 0
-        late_val = int(vals_sla.get(late_col, 0)) if late_col else 0
-
-        if p_other is not None and not p_other.empty:
-            vals_other = _aggregate_for_admin(admin_txt, p_other)
-            other_val = int(vals_other.sum())
-        else:
-            other_val = 0
+        m = metrics[admin_txt]
+        open_val = m["open"]
+        reopen_val = m["reopen"]
+        near_val = m["near"]
+        late_val = m["late"]
+        other_val = m["other"]
 
         if colmap["open"] is not None:
-            cells[colmap["open"]].text = str(open_val)
+            _set_cell_number(cells[colmap["open"]], open_val)
         if colmap["reopen"] is not None:
-            cells[colmap["reopen"]].text = str(reopen_val)
+            _set_cell_number(cells[colmap["reopen"]], reopen_val)
         if colmap["near"] is not None:
-            cells[colmap["near"]].text = str(near_val)
+            _set_cell_number(cells[colmap["near"]], near_val)
         if colmap["late"] is not None:
-            cells[colmap["late"]].text = str(late_val)
+            _set_cell_number(cells[colmap["late"]], late_val)
         if colmap["other"] is not None:
-            cells[colmap["other"]].text = str(other_val)
+            _set_cell_number(cells[colmap["other"]], other_val)
 
         total_open += open_val
         total_reopen += reopen_val
@@ -356,20 +458,15 @@ def _fill_main_table(
     if total_row_idx is not None:
         cells = table.rows[total_row_idx].cells
         if colmap["open"] is not None:
-            cells[colmap["open"]].text = str(total_open)
-            _make_cell_text_white(cells[colmap["open"]])
+            _set_cell_number(cells[colmap["open"]], total_open)
         if colmap["reopen"] is not None:
-            cells[colmap["reopen"]].text = str(total_reopen)
-            _make_cell_text_white(cells[colmap["reopen"]])
+            _set_cell_number(cells[colmap["reopen"]], total_reopen)
         if colmap["near"] is not None:
-            cells[colmap["near"]].text = str(total_near)
-            _make_cell_text_white(cells[colmap["near"]])
+            _set_cell_number(cells[colmap["near"]], total_near)
         if colmap["late"] is not None:
-            cells[colmap["late"]].text = str(total_late)
-            _make_cell_text_white(cells[colmap["late"]])
+            _set_cell_number(cells[colmap["late"]], total_late)
         if colmap["other"] is not None:
-            cells[colmap["other"]].text = str(total_other)
-            _make_cell_text_white(cells[colmap["other"]])
+            _set_cell_number(cells[colmap["other"]], total_other)
 
     return total_open, total_near, total_late, total_other
 
@@ -377,13 +474,8 @@ def _fill_main_table(
 def _fill_side_tables(
     slide,
     main_table,
-    p_open: pd.DataFrame,
-    p_sla: pd.DataFrame,
-    p_other: pd.DataFrame | None,
+    metrics: _AdminMetrics,
 ):
-    reopen_col = _find_reopen_column(p_open)
-    near_col, late_col = _find_sla_columns(p_sla)
-
     for shape in slide.shapes:
         if not shape.has_table:
             continue
@@ -399,124 +491,131 @@ def _fill_side_tables(
         n_rows = len(table.rows)
         for r in range(1, n_rows):
             cells = table.rows[r].cells
-            admin_txt = cells[admin_idx].text.strip()
+            admin_txt = _cell_admin_name(cells[admin_idx])
             if not admin_txt:
                 continue
             if "الاجمالي" in _norm_ar(admin_txt):
                 continue
 
-            vals_open = _aggregate_for_admin(admin_txt, p_open)
-            if reopen_col is not None:
-                reopen_val = int(vals_open.get(reopen_col, 0))
-            else:
-                reopen_val = 0
-            open_val = int(vals_open.sum() - reopen_val)
-
-            vals_sla = _aggregate_for_admin(admin_txt, p_sla)
-            near_val = int(vals_sla.get(near_col, 0)) if near_col else 0
-            late_val = int(vals_sla.get(late_col, 0)) if late_col else 0
-
-            if p_other is not None and not p_other.empty:
-                vals_other = _aggregate_for_admin(admin_txt, p_other)
-                other_val = int(vals_other.sum())
-            else:
-                other_val = 0
+            m = metrics[admin_txt]
+            open_val = m["open"]
+            reopen_val = m["reopen"]
+            near_val = m["near"]
+            late_val = m["late"]
+            other_val = m["other"]
 
             if colmap["open"] is not None:
-                cells[colmap["open"]].text = str(open_val)
+                _set_cell_number(cells[colmap["open"]], open_val)
             if colmap["reopen"] is not None:
-                cells[colmap["reopen"]].text = str(reopen_val)
+                _set_cell_number(cells[colmap["reopen"]], reopen_val)
             if colmap["near"] is not None:
-                cells[colmap["near"]].text = str(near_val)
+                _set_cell_number(cells[colmap["near"]], near_val)
             if colmap["late"] is not None:
-                cells[colmap["late"]].text = str(late_val)
+                _set_cell_number(cells[colmap["late"]], late_val)
             if colmap["other"] is not None:
-                cells[colmap["other"]].text = str(other_val)
+                _set_cell_number(cells[colmap["other"]], other_val)
 
 
 _CARD_PATTERN = re.compile(r"\{CARD_(OPEN|NEAR|LATE|OTHER)([^}]*)\}", re.DOTALL)
 
 
-def _fill_left_cards(
-    prs: Presentation,
-    p_open: pd.DataFrame,
-    p_sla: pd.DataFrame,
-    p_other: pd.DataFrame | None,
-):
-    reopen_col = _find_reopen_column(p_open)
-    near_col, late_col = _find_sla_columns(p_sla)
-
-    cache: dict[str, dict[str, int]] = {}
-
-    def get_metrics(admin_name: str) -> dict[str, int]:
-        admin_name = admin_name.strip()
-        if not admin_name:
-            return {"open": 0, "near": 0, "late": 0, "other": 0}
-
-        if admin_name in cache:
-            return cache[admin_name]
+def _card_admin_name(rest: str) -> str:
+    admin = rest.replace("\n", " ").replace("\v", " ")
+    admin = admin.replace(":", " ").replace("ـ", " ").replace("-", " ")
+    return admin.strip()
 
-        vals_open = _aggregate_for_admin(admin_name, p_open)
-        if reopen_col is not None:
-            reopen_val = int(vals_open.get(reopen_col, 0))
-        else:
-            reopen_val = 0
-        open_val = int(vals_open.sum() - reopen_val)
 
-        vals_sla = _aggregate_for_admin(admin_name, p_sla)
-        near_val = int(vals_sla.get(near_col, 0)) if near_col else 0
-        late_val = int(vals_sla.get(late_col, 0)) if late_col else 0
+def _card_match_admin(match: re.Match) -> str:
+    return _card_admin_name(match.group(2) or "")
 
-        if p_other is not None and not p_other.empty:
-            vals_other = _aggregate_for_admin(admin_name, p_other)
-            other_val = int(vals_other.sum())
-        else:
-            other_val = 0
 
-        metrics = {
-            "open": open_val,
-            "near": near_val,
-            "late": late_val,
-            "other": other_val,
-        }
-        cache[admin_name] = metrics
-        return metrics
+_TOTAL_TOKENS = ("{OPEN_TOTAL}", "{NEAR_SLA_TOTAL}", "{LATE_TOTAL}", "{OTHER_TOTAL}")
 
-    from pptx.enum.text import PP_ALIGN
 
+def _index_placeholders(prs: Presentation) -> dict[str, list]:
+    index: dict[str, list] = {"CARD": [], "DATE": [], "TOTAL": []}
     for slide in prs.slides:
         for shape in slide.shapes:
             if not shape.has_text_frame:
                 continue
-            txt = shape.text
-            if "CARD_" not in txt:
+            # every placeholder opens with "{"; skip the rest without joining runs
+            if not any(
+                "{" in run.text
+                for p in shape.text_frame.paragraphs
+                for run in p.runs
+            ):
                 continue
+            txt = shape.text
+            if "CARD_" in txt:
+                index["CARD"].append(shape)
+            if "{DATE}" in txt:
+                index["DATE"].append(shape)
+            if any(token in txt for token in _TOTAL_TOKENS):
+                index["TOTAL"].append(shape)
+    return index
 
-            def repl(match: re.Match) -> str:
-                kind = match.group(1).upper()
-                rest = match.group(2) or ""
-
-                admin = rest.replace("\n", " ")
-                admin = admin.replace(":", " ").replace("ـ", " ").replace("-", " ")
-                admin = admin.strip()
-
-                metrics = get_metrics(admin)
-                key_map = {
-                    "OPEN": "open",
-                    "NEAR": "near",
-                    "LATE": "late",
-                    "OTHER": "other",
-                }
-                return str(metrics.get(key_map[kind], 0))
-
-            new_txt = _CARD_PATTERN.sub(repl, txt)
-            if new_txt != txt:
-                shape.text = new_txt
-                tf = shape.text_frame
-                for p in tf.paragraphs:
-                    p.alignment = PP_ALIGN.CENTER
-                    for run in p.runs:
-                        run.font.color.rgb = RGBColor(255, 255, 255)
+
+def _collect_slide_admins(slide, card_shapes: list) -> set[str]:
+    admins: set[str] = set()
+
+    for shape in slide.shapes:
+        if not shape.has_table:
+            continue
+        table = shape.table
+        admin_idx = _detect_main_columns(table)["admin"]
+        for r in range(1, len(table.rows)):
+            admin_txt = _cell_admin_name(table.rows[r].cells[admin_idx])
+            if admin_txt and "الاجمالي" not in _norm_ar(admin_txt):
+                admins.add(admin_txt)
+
+    for shape in card_shapes:
+        for match in _CARD_PATTERN.finditer(shape.text_frame.text):
+            admin = _card_match_admin(match)
+            if admin:
+                admins.add(admin)
+
+    return admins
+
+
+def _fill_left_cards(
+    card_shapes: list,
+    metrics: _AdminMetrics,
+):
+    from pptx.enum.text import PP_ALIGN
+
+    key_map = {
+        "OPEN": "open",
+        "NEAR": "near",
+        "LATE": "late",
+        "OTHER": "other",
+    }
+
+    def repl(match: re.Match) -> str:
+        kind = match.group(1).upper()
+        m = metrics[_card_match_admin(match)]
+        return str(m.get(key_map[kind], 0))
+
+    for shape in card_shapes:
+        if not _replace_in_shape(shape, lambda t: _CARD_PATTERN.sub(repl, t)):
+            continue
+        # the template's placeholder runs are small authoring styles; render
+        # the numbers at the default size in white instead
+        for p in shape.text_frame.paragraphs:
+            p.alignment = PP_ALIGN.CENTER
+            for el in p._p.findall(qn("a:r")) + p._p.findall(qn("a:br")):
+                rPr = el.find(qn("a:rPr"))
+                if rPr is not None:
+                    el.remove(rPr)
+            end_rPr = p._p.find(qn("a:endParaRPr"))
+            if end_rPr is not None:
+                p._p.remove(end_rPr)
+            for run in p.runs:
+                run.font.color.rgb = RGBColor(255, 255, 255)
+
+
+@lru_cache(maxsize=None)
+def _template_bytes(template_path: str) -> bytes:
+    return Path(template_path).read_bytes()
 
 
 def fill_ppt(
@@ -526,23 +625,26 @@ def fill_ppt(
     p_other: pd.DataFrame | None,
     closed_dt: pd.Timestamp,
 ) -> BytesIO:
-    prs = Presentation(template_path)
+    prs = Presentation(BytesIO(_template_bytes(template_path)))
     slide = prs.slides[0]
 
     main_table = _find_main_table(slide)
+    placeholders = _index_placeholders(prs)
+    slide_admins = _collect_slide_admins(slide, placeholders["CARD"])
+    metrics = _compute_metrics(slide_admins, p_open, p_sla, p_other)
 
     open_total_all, near_total_all, late_total_all, other_total_all = _fill_main_table(
-        main_table, p_open, p_sla, p_other
+        main_table, metrics
     )
 
-    _fill_side_tables(slide, main_table, p_open, p_sla, p_other)
+    _fill_side_tables(slide, main_table, metrics)
 
-    _fill_left_cards(prs, p_open, p_sla, p_other)
+    _fill_left_cards(placeholders["CARD"], metrics)
 
-    _fill_date_placeholder(prs, closed_dt)
+    _fill_date_placeholder(placeholders["DATE"], closed_dt)
 
     _fill_total_placeholders(
-        prs,
+        placeholders["TOTAL"],
         open_total_all=open_total_all,
         near_total_all=near_total_all,
         late_total_all=late_total_all,